@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import json
+import uuid
 
 st.set_page_config(
     page_title="Autonomous QA Agent",
@@ -8,6 +9,26 @@ st.set_page_config(
 )
 
 API_URL = "http://localhost:8000"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def stream_multipart(files, boundary):
+    """Yield a multipart/form-data body chunk by chunk instead of building it in memory"""
+    for field, (filename, fileobj, content_type) in files:
+        # Quoted-string escaping, which the backend's multipart parser reverses; line breaks cannot be quoted
+        filename = filename.replace("\\", "\\\\").replace('"', '\\"').replace("\r", " ").replace("\n", " ")
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n"
+        ).encode('utf-8')
+        fileobj.seek(0)
+        while True:
+            chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode('utf-8')
 
 if 'kb_built' not in st.session_state:
     st.session_state.kb_built = False
@@ -68,17 +89,28 @@ with st.sidebar:
         else:
             with st.spinner("Building Vector Database Knowledge Base..."):
                 files_to_upload = []
-                files_to_upload.append(('files', (html_file.name, html_file.getvalue(), 'text/html')))
+                files_to_upload.append(('files', (html_file.name, html_file, 'text/html')))
                 st.session_state.html_content = html_file.getvalue().decode('utf-8')
                 
                 for doc in support_docs:
-                    files_to_upload.append(('files', (doc.name, doc.getvalue(), doc.type)))
+                    files_to_upload.append(('files', (doc.name, doc, doc.type)))
                 
                 filenames = [html_file.name] + [doc.name for doc in support_docs]
                 st.session_state.uploaded_files = filenames
                 
                 try:
-                    response = requests.post(f"{API_URL}/upload-and-build-kb", files=files_to_upload)
+                    boundary = uuid.uuid4().hex
+                    response = requests.post(
+                        f"{API_URL}/upload-and-build-kb",
+                        data=stream_multipart(files_to_upload, boundary),
+                        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+                    )
+                    if not response.ok:
+                        try:
+                            detail = response.json().get('detail', response.text)
+                        except ValueError:
+                            detail = response.text
+                        raise Exception(f"HTTP {response.status_code}: {detail}")
                     data = response.json()
                     
                     st.session_state.kb_built = True
@@ -220,6 +252,8 @@ else:
                     st.session_state.generated_script = data['script']
                     st.session_state.auto_generate_script = False
                     st.success("Script Generated!")
+                    if data.get('reused'):
+                        st.info(f"Reused from script library (similarity {data['similarity']:.2f})")
                 except Exception as e:
                     st.session_state.auto_generate_script = False  
                     st.error(f"Error: {str(e)}")
@@ -254,6 +288,8 @@ else:
                             data = response.json()
                             st.session_state.generated_script = data['script']
                             st.success("Script Generated!")
+                            if data.get('reused'):
+                                st.info(f"Reused from script library (similarity {data['similarity']:.2f})")
                         except Exception as e:
                             st.error(f"Error: {str(e)}")
             
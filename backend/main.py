@@ -1,15 +1,26 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict
 import os
-import shutil
+import json
+import time
+import codecs
+import hashlib
+import tempfile
+import uuid
 from dotenv import load_dotenv
 import chromadb
 from chromadb.config import Settings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
 import google.generativeai as genai
-from utils import extract_text_from_pdf, parse_json, parse_markdown
+from utils import extract_text_from_pdf_stream, parse_json_text, extract_element_index, extract_script_locators, extract_test_literals, extract_script_inputs
 
 load_dotenv()
 
@@ -49,9 +60,48 @@ if GEMINI_API_KEY and GEMINI_API_KEY != "dummy_key_placeholder":
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", 20 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", 50 * 1024 * 1024))
+SUPPORTED_EXTENSIONS = (".html", ".pdf", ".md", ".txt", ".json")
+
+SCRIPT_REUSE_THRESHOLD = float(os.getenv("SCRIPT_REUSE_THRESHOLD", 0.92))
+SCRIPT_LIBRARY_DIR = os.getenv("SCRIPT_LIBRARY_DIR", "script_library")
+
 knowledge_base = None
 html_content_global = ""
 
+script_library_client = chromadb.PersistentClient(
+    path=SCRIPT_LIBRARY_DIR,
+    settings=Settings(anonymized_telemetry=False)
+)
+script_library = script_library_client.get_or_create_collection(
+    name="script_library",
+    metadata={"description": "Previously generated Selenium scripts", "hnsw:space": "cosine"}
+)
+script_library_counters = script_library_client.get_or_create_collection(
+    name="script_library_stats",
+    metadata={"description": "Script library reuse counters"}
+)
+
+def load_script_library_stats() -> Dict:
+    """Load the persisted reuse counters"""
+    stats = {"requests": 0, "reused": 0, "latency_saved_seconds": 0.0}
+    stored = script_library_counters.get(ids=["totals"])
+    if stored['ids']:
+        stats.update(stored['metadatas'][0])
+    return stats
+
+def save_script_library_stats():
+    """Persist the reuse counters next to the script library"""
+    script_library_counters.upsert(
+        ids=["totals"],
+        embeddings=[[1.0]],
+        documents=["totals"],
+        metadatas=[script_library_stats]
+    )
+
+script_library_stats = load_script_library_stats()
+
 class TestCaseRequest(BaseModel):
     query: str = "Generate all test cases"
 
@@ -59,48 +109,251 @@ class ScriptRequest(BaseModel):
     test_case: str
     html_content: str
 
-@app.post("/upload-and-build-kb")
-async def upload_and_build_kb(files: List[UploadFile] = File(...)):
-    """Upload files and build vector database knowledge base"""
-    global knowledge_base, html_content_global
+def find_reusable_script(test_case: str, query_embedding: List[float], html_content: str):
+    """Return the nearest stored script that tests the same data and whose elements exist on both pages"""
+    if script_library.count() == 0:
+        return None
     
     try:
-        try:
-            chroma_client.delete_collection("qa_knowledge_base")
-        except:
-            pass
+        results = script_library.query(
+            query_embeddings=[query_embedding],
+            n_results=min(5, script_library.count())
+        )
+    except Exception:
+        return None
+    
+    literals = extract_test_literals(test_case)
+    current_index = None
+    for script, meta, distance in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
+        similarity = 1 - distance
+        if similarity < SCRIPT_REUSE_THRESHOLD:
+            break
         
-        knowledge_base = chroma_client.create_collection(
-            name="qa_knowledge_base",
-            metadata={"description": "QA documentation knowledge base"}
+        if set(json.loads(meta['test_literals'])) != literals:
+            continue
+        if not all(value in test_case.lower() for value in extract_script_inputs(script)):
+            continue
+        
+        locators = set(json.loads(meta['locators']))
+        if meta['unverifiable_locators'] or not locators:
+            continue
+        if not locators.issubset(json.loads(meta['element_index'])):
+            continue
+        if current_index is None:
+            current_index = extract_element_index(html_content)
+        if not locators.issubset(current_index):
+            continue
+        
+        return {
+            "script": script,
+            "similarity": similarity,
+            "generation_seconds": meta['generation_seconds']
+        }
+    return None
+
+def store_script(test_case: str, query_embedding: List[float], script: str, html_content: str, generation_seconds: float):
+    """Add a generated script to the script library with the element index of the page it targeted"""
+    locators, unverifiable = extract_script_locators(script)
+    try:
+        script_library.add(
+            documents=[script],
+            embeddings=[query_embedding],
+            metadatas=[{
+                "test_case": test_case[:1000],
+                "test_literals": json.dumps(sorted(extract_test_literals(test_case))),
+                "locators": json.dumps(sorted(locators)),
+                "unverifiable_locators": unverifiable,
+                "element_index": json.dumps(sorted(extract_element_index(html_content))),
+                "generation_seconds": generation_seconds
+            }],
+            ids=[f"script_{uuid.uuid4().hex}"]
         )
+    except Exception:
+        pass
+
+class UploadIngestor:
+    """Multipart parser callbacks that hash, store and decode each file part as it arrives"""
+    
+    def __init__(self):
+        self.files = []
+        self.file_parts = 0
+        self.complete = False
+        self._created_paths = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part = None
+    
+    @property
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        }
+    
+    def on_part_begin(self):
+        self._headers = {}
+        self._part = None
+    
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+    
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"files" or b"filename" not in options:
+            return
+        self.file_parts += 1
+        
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            return
         
+        self._part = {
+            "filename": filename,
+            "ext": ext,
+            "decoder": None if ext == ".pdf" else codecs.getincrementaldecoder("utf-8")(),
+            "digest": hashlib.sha256(),
+            "text_parts": [],
+            "size": 0,
+            "tmp": tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=".part", delete=False)
+        }
+    
+    def on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part is None:
+            return
+        chunk = data[start:end]
+        part["size"] += len(chunk)
+        if part["size"] > MAX_FILE_BYTES:
+            raise HTTPException(status_code=413, detail=f"{part['filename']} exceeds the {MAX_FILE_BYTES} byte per-file limit")
+        part["digest"].update(chunk)
+        part["tmp"].write(chunk)
+        if part["decoder"]:
+            part["text_parts"].append(self._decode(part, chunk))
+    
+    def on_part_end(self):
+        part = self._part
+        if part is None:
+            return
+        tmp = part["tmp"]
+        if part["decoder"]:
+            part["text_parts"].append(self._decode(part, b"", final=True))
+            content = "".join(part["text_parts"])
+        else:
+            tmp.flush()
+            tmp.seek(0)
+            content = extract_text_from_pdf_stream(tmp)
+        tmp.close()
+        
+        sha256 = part["digest"].hexdigest()
+        stored_path = os.path.join(UPLOAD_DIR, sha256 + part["ext"])
+        if os.path.exists(stored_path):
+            os.remove(tmp.name)
+        else:
+            os.replace(tmp.name, stored_path)
+            self._created_paths.append(stored_path)
+        
+        self.files.append({
+            "filename": part["filename"],
+            "content": content,
+            "sha256": sha256,
+            "size": part["size"]
+        })
+        self._part = None
+    
+    def on_end(self):
+        self.complete = True
+    
+    def _decode(self, part: Dict, chunk: bytes, final: bool = False) -> str:
+        try:
+            return part["decoder"].decode(chunk, final=final)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail=f"{part['filename']} is not valid UTF-8")
+    
+    def discard(self):
+        """Remove the interrupted part and any files this rejected request stored"""
+        if self._part is not None:
+            self._part["tmp"].close()
+            os.remove(self._part["tmp"].name)
+            self._part = None
+        for path in self._created_paths:
+            os.remove(path)
+        self._created_paths = []
+
+async def stream_uploads(request: Request) -> UploadIngestor:
+    """Parse the raw multipart request body, enforcing the per-request limit as bytes arrive"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if content_length > MAX_REQUEST_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_REQUEST_BYTES} byte per-request limit")
+    
+    ingestor = UploadIngestor()
+    parser = MultipartParser(options[b"boundary"], ingestor.callbacks)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_REQUEST_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_REQUEST_BYTES} byte per-request limit")
+            parser.write(chunk)
+        parser.finalize()
+        if not ingestor.complete:
+            raise HTTPException(status_code=400, detail="Truncated multipart body")
+    except MultipartParseError as e:
+        ingestor.discard()
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {str(e)}")
+    except BaseException:
+        ingestor.discard()
+        raise
+    
+    if ingestor.file_parts == 0:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    return ingestor
+
+@app.post("/upload-and-build-kb")
+async def upload_and_build_kb(request: Request):
+    """Upload files and build vector database knowledge base"""
+    global knowledge_base, html_content_global
+    
+    ingestor = await stream_uploads(request)
+    
+    try:
         documents = []
         metadatas = []
         ids = []
         doc_id = 0
+        html_content = None
         
-        for file in files:
-            file_path = os.path.join(UPLOAD_DIR, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            if file.filename.endswith(".html"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    html_content_global = f.read()
-                content = f"HTML Structure: {html_content_global[:1000]}"  
-            elif file.filename.endswith(".pdf"):
-                content = extract_text_from_pdf(file_path)
-            elif file.filename.endswith(".md"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            elif file.filename.endswith(".txt"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            elif file.filename.endswith(".json"):
-                content = parse_json(file_path)
-            else:
-                continue
+        for file in ingestor.files:
+            content = file["content"]
+            if file["filename"].lower().endswith(".html"):
+                html_content = content
+                content = f"HTML Structure: {html_content[:1000]}"  
+            elif file["filename"].lower().endswith(".json"):
+                content = parse_json_text(content)
             
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=500,
@@ -113,24 +366,44 @@ async def upload_and_build_kb(files: List[UploadFile] = File(...)):
                 if chunk.strip():
                     documents.append(chunk)
                     metadatas.append({
-                        "source_document": file.filename,
+                        "source_document": file["filename"],
+                        "sha256": file["sha256"],
                         "chunk_index": i
                     })
                     ids.append(f"doc_{doc_id}")
                     doc_id += 1
         
-        if documents:
-            embeddings = [get_embedding(doc) for doc in documents]
-            knowledge_base.add(
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
+        embeddings = [get_embedding(doc) for doc in documents]
+        
+        staging_name = f"qa_knowledge_base_{uuid.uuid4().hex}"
+        staging = chroma_client.create_collection(
+            name=staging_name,
+            metadata={"description": "QA documentation knowledge base"}
+        )
+        try:
+            if documents:
+                staging.add(
+                    documents=documents,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+        except Exception:
+            chroma_client.delete_collection(staging_name)
+            raise
+        
+        if knowledge_base is not None:
+            try:
+                chroma_client.delete_collection(knowledge_base.name)
+            except:
+                pass
+        knowledge_base = staging
+        if html_content is not None:
+            html_content_global = html_content
         
         return {
             "status": "success",
-            "message": f"Knowledge base built with {len(documents)} chunks from {len(files)} files",
+            "message": f"Knowledge base built with {len(documents)} chunks from {ingestor.file_parts} files",
             "num_chunks": len(documents)
         }
     except Exception as e:
@@ -226,7 +499,22 @@ async def generate_script(request: ScriptRequest):
         raise HTTPException(status_code=400, detail="Knowledge base not built")
     
     try:
+        start = time.perf_counter()
+        script_library_stats["requests"] += 1
         query_embedding = get_embedding(request.test_case)
+        
+        reusable = find_reusable_script(request.test_case, query_embedding, request.html_content)
+        if reusable:
+            lookup_seconds = time.perf_counter() - start
+            script_library_stats["reused"] += 1
+            script_library_stats["latency_saved_seconds"] += max(reusable["generation_seconds"] - lookup_seconds, 0.0)
+            save_script_library_stats()
+            return {
+                "script": reusable["script"],
+                "reused": True,
+                "similarity": round(reusable["similarity"], 4)
+            }
+        
         results = knowledge_base.query(
             query_embeddings=[query_embedding],
             n_results=3
@@ -274,12 +562,29 @@ driver.get("file:///path/to/checkout.html")  # USER MUST UPDATE THIS PATH
             script = script.split("```python")[1].split("```")[0]
         elif "```" in script:
             script = script.split("```")[1].split("```")[0]
+        script = script.strip()
         
-        return {"script": script.strip()}
+        store_script(request.test_case, query_embedding, script, request.html_content, time.perf_counter() - start)
+        save_script_library_stats()
+        
+        return {"script": script, "reused": False}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/script-library/stats")
+async def script_library_statistics():
+    """Report script reuse rate and latency saved"""
+    requests_count = script_library_stats["requests"]
+    return {
+        "stored_scripts": script_library.count(),
+        "requests": requests_count,
+        "reused": script_library_stats["reused"],
+        "reuse_rate": script_library_stats["reused"] / requests_count if requests_count else 0.0,
+        "latency_saved_seconds": round(script_library_stats["latency_saved_seconds"], 3),
+        "threshold": SCRIPT_REUSE_THRESHOLD
+    }
+
 @app.get("/")
 async def root():
     return {"message": "QA Agent Backend Running"}
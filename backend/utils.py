@@ -1,26 +1,35 @@
 import pypdf
 from bs4 import BeautifulSoup
+import ast
 import json
+import re
 
 def extract_text_from_pdf(file_path: str) -> str:
     """Extract text from PDF with robust error handling"""
-    text = ""
     try:
         with open(file_path, 'rb') as file:
-            reader = pypdf.PdfReader(file)
-            
-            if reader.is_encrypted:
-                return "Error: PDF is encrypted"
-            
-            max_pages = min(len(reader.pages), 50)
-            for i in range(max_pages):
-                try:
-                    page_text = reader.pages[i].extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                except Exception as e:
-                    continue
-                    
+            return extract_text_from_pdf_stream(file)
+    except Exception as e:
+        return f"Error reading PDF: {str(e)}"
+
+def extract_text_from_pdf_stream(stream) -> str:
+    """Extract text from an open binary PDF stream"""
+    text = ""
+    try:
+        reader = pypdf.PdfReader(stream)
+        
+        if reader.is_encrypted:
+            return "Error: PDF is encrypted"
+        
+        max_pages = min(len(reader.pages), 50)
+        for i in range(max_pages):
+            try:
+                page_text = reader.pages[i].extract_text()
+                if page_text:
+                    text += page_text + "\n"
+            except Exception as e:
+                continue
+                
     except Exception as e:
         return f"Error reading PDF: {str(e)}"
     
@@ -30,8 +39,14 @@ def parse_json(file_path: str) -> str:
     """Parse JSON file and convert to readable text"""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return json.dumps(data, indent=2)
+            return parse_json_text(f.read())
+    except Exception as e:
+        return f"Error parsing JSON: {str(e)}"
+
+def parse_json_text(text: str) -> str:
+    """Parse JSON text and convert to readable text"""
+    try:
+        return json.dumps(json.loads(text), indent=2)
     except Exception as e:
         return f"Error parsing JSON: {str(e)}"
 
@@ -42,3 +57,116 @@ def parse_markdown(file_path: str) -> str:
             return f.read()
     except Exception as e:
         return f"Error reading markdown: {str(e)}"
+
+def extract_element_index(html_content: str) -> set:
+    """Index element ids, names and classes present in the HTML"""
+    index = set()
+    try:
+        soup = BeautifulSoup(html_content, 'html.parser')
+        for tag in soup.find_all(True):
+            if tag.get('id'):
+                index.add(f"id:{tag['id']}")
+            if tag.get('name'):
+                index.add(f"name:{tag['name']}")
+            for cls in tag.get('class', []):
+                index.add(f"class:{cls}")
+    except Exception:
+        pass
+    return index
+
+def _css_locators(selector: str) -> set:
+    """Collect ids, names and classes from a CSS selector"""
+    locators = set()
+    for attr, value in re.findall(r'\[\s*(id|name)\s*=\s*["\']?([\w-]+)', selector):
+        locators.add(f"{attr}:{value}")
+    selector = re.sub(r'\[[^\]]*\]', '', selector)
+    selector = re.sub(r'(["\']).*?\1', '', selector)
+    for value in re.findall(r'#([\w-]+)', selector):
+        locators.add(f"id:{value}")
+    for value in re.findall(r'\.([A-Za-z_][\w-]*)', selector):
+        locators.add(f"class:{value}")
+    return locators
+
+def _xpath_locators(xpath: str) -> set:
+    """Collect ids, names and classes from an XPath expression"""
+    locators = set()
+    for attr, _, value in re.findall(r'@(id|name)\s*=\s*(["\'])(.*?)\2', xpath):
+        locators.add(f"{attr}:{value}")
+    for _, value in re.findall(r'@class\s*=\s*(["\'])(.*?)\1', xpath):
+        locators.update(f"class:{cls}" for cls in value.split())
+    for _, value in re.findall(r'contains\(\s*@class\s*,\s*(["\'])(.*?)\1', xpath):
+        if value.strip():
+            locators.add(f"class:{value.strip()}")
+    return locators
+
+def extract_script_locators(script: str):
+    """Collect element ids, names and classes referenced by a Selenium script.
+
+    Returns the locator set and a flag that is True when the script locates
+    elements in a way that cannot be checked against the HTML element index
+    (link text, tag names, non-literal values, selectors without ids/names/classes).
+    """
+    kinds = {"ID": "id", "NAME": "name", "CLASS_NAME": "class"}
+    calls = re.findall(r'By\.(\w+)\s*,\s*(?:(["\'])(.*?)\2)?', script)
+    calls += [
+        (by.upper(), quote, value)
+        for by, quote, value in re.findall(r'find_elements?_by_(\w+)\(\s*(?:(["\'])(.*?)\2)?', script)
+    ]
+    
+    locators = set()
+    unverifiable = False
+    for by, _, value in calls:
+        if not value:
+            unverifiable = True
+            continue
+        if by in kinds:
+            found = {f"{kinds[by]}:{value}"}
+        elif by == "CSS_SELECTOR":
+            found = _css_locators(value)
+        elif by == "XPATH":
+            found = _xpath_locators(value)
+        else:
+            found = set()
+        if not found:
+            unverifiable = True
+        locators |= found
+    return locators, unverifiable
+
+NEGATION_WORDS = {
+    "invalid", "empty", "blank", "missing", "wrong", "incorrect", "expired",
+    "not", "no", "without", "fail", "fails", "failed", "error", "exceed", "exceeds"
+}
+
+def _test_case_text(test_case: str) -> str:
+    """Return the scenario text of a test case, dropping ids and source references"""
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            data = parse(test_case)
+        except Exception:
+            continue
+        if isinstance(data, dict):
+            return " ".join(
+                str(value) for key, value in data.items()
+                if key not in ("test_id", "grounded_in")
+            )
+    return test_case
+
+def extract_test_literals(test_case: str) -> set:
+    """Collect the data a test case depends on: quoted strings, codes, numbers and negations"""
+    text = _test_case_text(test_case)
+    literals = set()
+    for _, value in re.findall(r'(["\'])(.+?)\1', text):
+        literals.add(value.strip().lower())
+    for value in re.findall(r'[\w.@%$+-]*\d[\w.@%$+-]*', text):
+        literals.add(value.strip(".,").lower())
+    for value in re.findall(r'\b[A-Z][A-Z0-9_]{2,}\b', text):
+        literals.add(value.lower())
+    for word in re.findall(r'[a-z]+', text.lower()):
+        if word in NEGATION_WORDS:
+            literals.add(word)
+    literals.discard("")
+    return literals
+
+def extract_script_inputs(script: str) -> set:
+    """Collect the literal values a Selenium script types into the page"""
+    return {value.lower() for _, value in re.findall(r'send_keys\(\s*(["\'])(.*?)\1', script) if value}